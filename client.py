@@ -1,12 +1,14 @@
 # coding=utf-8
 
 import time
+import logging
 import hmac
 import hashlib
 import requests
 from urllib.parse import urlencode
 from utils.consts import *
 from utils.errors import *
+from utils.singleflight import SingleFlight
 from retrying import retry
 
 proxies = {
@@ -16,10 +18,17 @@ proxies = {
 
 class Client:
 
-    def __init__(self, key, secret):
+    def __init__(self, key, secret, coalesce_window=0.0):
+        '''
+        :param coalesce_window: 无签名 GET 请求完成后, 相同请求在该秒数内直接复用结果; 0 表示只合并同时在途的请求.
+            被合并的调用方拿到的是同一个 dict/list 对象, 不要原地修改接口返回值
+        '''
         self.key = key
         self.secret = secret
         self.header = {"X-MBX-APIKEY": self.key}
+        self._single_flight = SingleFlight(coalesce_window)
+        # 市价单下单前的检查, 签名 check(client, symbol, side, quantity), 抛异常则不下单
+        self.pre_trade_check = None
 
     ###########################################
     ##########      http方法      #############
@@ -42,9 +51,20 @@ class Client:
     def _get_without_sign(self, path, params={}):
         query = urlencode(params)
         url = "%s?%s" % (path, query)
-        return self._response_handler(self._get_response('GET_NO_SIGN', url))
+        return self._single_flight.do(url, self._get_without_sign_response, url)
         # return requests.get(url, timeout=7,  proxies=proxies, verify=True).json()
 
+    def _get_without_sign_response(self, url):
+        return self._response_handler(self._get_response('GET_NO_SIGN', url))
+
+    def coalesce_stats(self):
+        '''
+        请求合并统计
+        :return: {"requests": 实际发出的请求数, "saved": 被合并省掉的请求数}
+        注意: 被合并的调用方共享同一个返回对象, 见 coalesce_window
+        '''
+        return self._single_flight.stats()
+
     def _get(self, path, params={}):
         params.update({"recvWindow": 120000})
         query = urlencode(self._sign(params))
@@ -75,6 +95,12 @@ class Client:
 
 
     def _response_handler(self, response):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('response', extra={
+                'endpoint': response.request.path_url,
+                'latency': response.elapsed.total_seconds(),
+                'status_code': response.status_code,
+            })
         if not str(response.status_code).startswith('2'):
             raise BinanceAPIException(response)
         try:
@@ -305,10 +331,10 @@ class Client:
         return self._get_without_sign(path, params)
 
 
-    def get_recent_price(self, symbol):
+    def get_recent_price(self, symbol=None):
         '''
         最新价格接口, 返回最近价格
-        :param symbol:
+        :param symbol: 不传则返回所有交易对的价格
         :return:
             {
               "symbol": "LTCBTC",
@@ -328,7 +354,7 @@ class Client:
             ]
         '''
         path = "%s/ticker/price" % BASE_URL_V3
-        params = {"symbol": symbol}
+        params = {"symbol": symbol} if symbol else {}
         return self._get_without_sign(path, params)
 
     def get_book_ticker(self, symbol):
@@ -363,7 +389,7 @@ class Client:
             ]
 
         '''
-        path = "%s/ticker/price" % BASE_URL_V3
+        path = "%s/ticker/bookTicker" % BASE_URL_V3
         params = {"symbol": symbol}
         return self._get_without_sign(path, params)
 
@@ -404,10 +430,14 @@ class Client:
         return self._post(self._order_path(), params)
 
     def buy_symbol(self, symbol, quantity):
+        if self.pre_trade_check:
+            self.pre_trade_check(self, symbol, "BUY", quantity)
         params = self._order(symbol, quantity, "BUY")
         return self._post(self._order_path(), params)
 
     def sell_symbol(self, symbol, quantity):
+        if self.pre_trade_check:
+            self.pre_trade_check(self, symbol, "SELL", quantity)
         params = self._order(symbol, quantity, "SELL")
         return self._post(self._order_path(), params)
 
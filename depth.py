@@ -0,0 +1,228 @@
+# coding=utf-8
+
+import numpy as np
+from utils.errors import BinanceOrderException
+
+BPS = 1e4
+
+
+class Book:
+    '''
+    把 get_depth 返回的深度转成 numpy 数组, 预先算好累计挂单量和累计成交额.
+    bids 价格从高到低, asks 价格从低到高, 与接口返回顺序一致
+    '''
+
+    def __init__(self, depth):
+        self.bid_px, self.bid_qty = self._to_arrays(depth['bids'])
+        self.ask_px, self.ask_qty = self._to_arrays(depth['asks'])
+        self.bid_cum_qty = np.cumsum(self.bid_qty)
+        self.ask_cum_qty = np.cumsum(self.ask_qty)
+        self.bid_cum_notional = np.cumsum(self.bid_px * self.bid_qty)
+        self.ask_cum_notional = np.cumsum(self.ask_px * self.ask_qty)
+
+    @staticmethod
+    def _to_arrays(levels):
+        if not levels:
+            return np.empty(0), np.empty(0)
+        arr = np.array([level[:2] for level in levels], dtype=np.float64)
+        return arr[:, 0], arr[:, 1]
+
+    def _side(self, side):
+        '''
+        买单吃 asks, 卖单吃 bids
+        '''
+        if side == 'BUY':
+            return self.ask_px, self.ask_cum_qty, self.ask_cum_notional
+        return self.bid_px, self.bid_cum_qty, self.bid_cum_notional
+
+    def fill_price(self, side, quantity):
+        '''
+        市价单成交均价
+        :param side: BUY / SELL
+        :param quantity: 下单数量
+        :return: 成交均价, 深度不够时返回 nan
+        '''
+        px, cum_qty, cum_notional = self._side(side)
+        i = np.searchsorted(cum_qty, quantity)
+        if i >= len(cum_qty) or quantity <= 0:
+            return np.nan
+        notional = cum_notional[i] - (cum_qty[i] - quantity) * px[i]
+        return notional / quantity
+
+    def slippage(self, side, quantity):
+        '''
+        相对最优价的滑点, 单位 bps, 越大越差
+        '''
+        px = self._side(side)[0]
+        if len(px) == 0:
+            return np.nan
+        avg = self.fill_price(side, quantity)
+        if side == 'BUY':
+            return (avg / px[0] - 1) * BPS
+        return (1 - avg / px[0]) * BPS
+
+    def size_within(self, side, bps):
+        '''
+        距最优价 bps 以内可成交的数量
+        '''
+        px, cum_qty, _ = self._side(side)
+        if len(px) == 0:
+            return 0.0
+        if side == 'BUY':
+            n = np.searchsorted(px, px[0] * (1 + bps / BPS), side='right')
+        else:
+            n = np.searchsorted(-px, -px[0] * (1 - bps / BPS), side='right')
+        return cum_qty[n - 1] if n else 0.0
+
+    def imbalance(self, levels=None):
+        '''
+        买卖盘不平衡度 (bid - ask) / (bid + ask), 取前 levels 档, 范围 [-1, 1]
+        '''
+        bid = self.bid_qty[:levels].sum()
+        ask = self.ask_qty[:levels].sum()
+        total = bid + ask
+        return (bid - ask) / total if total else np.nan
+
+    def microprice(self):
+        '''
+        按最优档挂单量加权的中间价
+        '''
+        if not len(self.bid_px) or not len(self.ask_px):
+            return np.nan
+        bid_qty, ask_qty = self.bid_qty[0], self.ask_qty[0]
+        return (self.bid_px[0] * ask_qty + self.ask_px[0] * bid_qty) / (bid_qty + ask_qty)
+
+
+def _pad(books, attr, fill):
+    '''
+    把各个市场长度不同的数组补齐成二维数组
+    :return: (二维数组, 每行的实际长度)
+    '''
+    lengths = np.array([len(getattr(b, attr)) for b in books], dtype=np.int64)
+    out = np.full((len(books), max(lengths.max(), 1)), fill, dtype=np.float64)
+    for row, book in enumerate(books):
+        values = getattr(book, attr)
+        out[row, :len(values)] = values
+    return out, lengths
+
+
+def _row_searchsorted(a, v, side='left'):
+    '''
+    逐行二分查找, 每一行升序, 与 np.searchsorted 含义相同; 所有行一起做, 共 log2(列数) 轮
+    '''
+    rows = np.arange(a.shape[0])
+    lo = np.zeros(a.shape[0], dtype=np.int64)
+    hi = np.full(a.shape[0], a.shape[1], dtype=np.int64)
+    while True:
+        active = lo < hi
+        if not active.any():
+            return lo
+        mid = (lo + hi) // 2
+        x = a[rows, np.minimum(mid, a.shape[1] - 1)]
+        right = (x < v) if side == 'left' else (x <= v)
+        lo = np.where(active & right, mid + 1, lo)
+        hi = np.where(active & ~right, mid, hi)
+
+
+def _take(a, idx):
+    return np.take_along_axis(a, idx[:, None], axis=1)[:, 0]
+
+
+def batch_fill(depths, side, quantity):
+    '''
+    多个市场一起计算成交均价和滑点
+    :param depths: {symbol: get_depth 返回值}
+    :param side: BUY / SELL
+    :param quantity: 统一数量, 或 {symbol: 数量}
+    :return: {symbol: {"price": 成交均价, "slippage": 滑点 bps}}
+    '''
+    if not depths:
+        return {}
+    symbols = list(depths)
+    books = [Book(depths[s]) for s in symbols]
+    prefix = 'ask' if side == 'BUY' else 'bid'
+    px, _ = _pad(books, prefix + '_px', np.nan)
+    # 补 inf 保证每行升序, 补出的档位不会被选中
+    cum_qty, lengths = _pad(books, prefix + '_cum_qty', np.inf)
+    cum_notional, _ = _pad(books, prefix + '_cum_notional', np.nan)
+
+    if isinstance(quantity, dict):
+        qty = np.array([quantity[s] for s in symbols], dtype=np.float64)
+    else:
+        qty = np.full(len(symbols), quantity, dtype=np.float64)
+
+    idx = _row_searchsorted(cum_qty, qty)
+    valid = (idx < lengths) & (qty > 0)
+    idx = np.minimum(idx, cum_qty.shape[1] - 1)
+    level_px = _take(px, idx)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        notional = _take(cum_notional, idx) - (_take(cum_qty, idx) - qty) * level_px
+        price = np.where(valid, notional / qty, np.nan)
+        if side == 'BUY':
+            slip = (price / px[:, 0] - 1) * BPS
+        else:
+            slip = (1 - price / px[:, 0]) * BPS
+    return {s: {'price': float(price[i]), 'slippage': float(slip[i])} for i, s in enumerate(symbols)}
+
+
+def _batch_size_within(books, prefix, bps):
+    px, lengths = _pad(books, prefix + '_px', np.inf)
+    cum_qty, _ = _pad(books, prefix + '_cum_qty', np.nan)
+    if prefix == 'ask':
+        limit = px[:, 0] * (1 + bps / BPS)
+    else:
+        # bids 价格从高到低, 取负后变成升序
+        px = np.where(np.isinf(px), np.inf, -px)
+        limit = px[:, 0] * (1 - bps / BPS)
+    n = np.minimum(_row_searchsorted(px, limit, side='right'), lengths)
+    return np.where(n > 0, _take(cum_qty, np.maximum(n - 1, 0)), 0.0)
+
+
+def batch_stats(depths, levels=None, bps=None):
+    '''
+    多个市场一起计算不平衡度, microprice 和 bps 以内的挂单量
+    :param levels: 不平衡度取前几档, 默认全部
+    :param bps: 传入时额外返回距最优价 bps 以内的买盘/卖盘数量
+    :return: {symbol: {"imbalance": ..., "microprice": ..., "bid_size": ..., "ask_size": ...}}
+    '''
+    if not depths:
+        return {}
+    symbols = list(depths)
+    books = [Book(depths[s]) for s in symbols]
+    bid_px, _ = _pad(books, 'bid_px', np.nan)
+    ask_px, _ = _pad(books, 'ask_px', np.nan)
+    bid_qty, _ = _pad(books, 'bid_qty', 0.0)
+    ask_qty, _ = _pad(books, 'ask_qty', 0.0)
+
+    bid = bid_qty[:, :levels].sum(axis=1)
+    ask = ask_qty[:, :levels].sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        imbalance = (bid - ask) / (bid + ask)
+        microprice = ((bid_px[:, 0] * ask_qty[:, 0] + ask_px[:, 0] * bid_qty[:, 0])
+                      / (bid_qty[:, 0] + ask_qty[:, 0]))
+
+    result = {s: {'imbalance': float(imbalance[i]), 'microprice': float(microprice[i])}
+              for i, s in enumerate(symbols)}
+    if bps is not None:
+        bid_size = _batch_size_within(books, 'bid', bps)
+        ask_size = _batch_size_within(books, 'ask', bps)
+        for i, s in enumerate(symbols):
+            result[s]['bid_size'] = float(bid_size[i])
+            result[s]['ask_size'] = float(ask_size[i])
+    return result
+
+
+def slippage_guard(max_bps, limit=100):
+    '''
+    生成市价单下单前的检查函数, 用法: client.pre_trade_check = slippage_guard(20)
+    预估滑点超过 max_bps 或深度不够时抛出 BinanceOrderException
+    '''
+    def check(client, symbol, side, quantity):
+        slip = Book(client.get_depth(symbol, limit)).slippage(side, quantity)
+        if np.isnan(slip):
+            raise BinanceOrderException(-1, 'insufficient depth for %s %s %s within %d levels'
+                                        % (side, quantity, symbol, limit))
+        if slip > max_bps:
+            raise BinanceOrderException(-1, 'estimated slippage %.2f bps exceeds %.2f bps for %s %s %s'
+                                        % (slip, max_bps, side, quantity, symbol))
+    return check
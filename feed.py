@@ -0,0 +1,260 @@
+# coding=utf-8
+
+import struct
+import sys
+import time
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+from utils.log import setup_custom_logger
+
+logger = setup_custom_logger('root')
+
+DATA_DEPTH = 1
+DATA_BOOK_TICKER = 2
+DATA_KLINE = 3
+
+_MAGIC = 0x424e4246  # 'BNBF'
+
+# 头部: magic, 槽位数, 槽位大小, 已写入的消息总数
+_HEADER = struct.Struct('<IIIxxxxQ')
+# 槽位头: 状态戳, 该 symbol/类型 的序号, 时间戳(ms), 类型, symbol, 数据长度; 补齐到 8 字节对齐
+_SLOT = struct.Struct('<QQQB16sIxxx')
+# 深度数据头: lastUpdateId, 买盘档数, 卖盘档数, 后面跟 (买盘 + 卖盘) x [价格, 数量] 的 float64
+_DEPTH = struct.Struct('<QII')
+# K线每根的字段数: 开盘时间, 开, 高, 低, 收, 成交量, 收盘时间
+KLINE_FIELDS = 7
+_STAMP = struct.Struct('<Q')
+_COUNT = struct.Struct('<Q')
+
+# 本进程里 FeedWriter 创建的共享内存, 同进程的读端不能把它从 resource_tracker 里注销
+_created = set()
+
+
+class FeedOverrunError(Exception):
+    def __init__(self, lost):
+        self.lost = lost
+
+    def __str__(self):
+        return 'FeedOverrunError: reader fell behind, %d messages lost' % self.lost
+
+
+def encode_depth(depth):
+    '''
+    get_depth 返回值 -> 定长二进制: _DEPTH 头 + float64 [价格, 数量] 数组
+    '''
+    bids, asks = depth['bids'], depth['asks']
+    values = array('d')
+    for price, qty, *_ in bids:
+        values.append(float(price))
+        values.append(float(qty))
+    for price, qty, *_ in asks:
+        values.append(float(price))
+        values.append(float(qty))
+    return _DEPTH.pack(depth['lastUpdateId'], len(bids), len(asks)) + values.tobytes()
+
+
+def encode_book_ticker(ticker):
+    '''
+    get_book_ticker 返回值 -> float64 [bidPrice, bidQty, askPrice, askQty]
+    '''
+    return array('d', [float(ticker[k]) for k in ('bidPrice', 'bidQty', 'askPrice', 'askQty')]).tobytes()
+
+
+def encode_kline(klines):
+    '''
+    get_kline 返回值 -> float64 [根数, KLINE_FIELDS] 数组, 时间戳在 2^53 以内, 用 float64 不丢精度
+    '''
+    values = array('d')
+    for k in klines:
+        values.extend([k[0], float(k[1]), float(k[2]), float(k[3]), float(k[4]), float(k[5]), k[6]])
+    return values.tobytes()
+
+
+def _rows(view, n, width):
+    # memoryview 不能 cast 成带 0 的 shape, 没有数据时返回一维的空 view
+    if n == 0:
+        return view[0:0].cast('d')
+    return view.cast('d', [n, width])
+
+
+def decode(data_type, raw):
+    '''
+    把槽位里的二进制数据解成 memoryview, 不做逐个数值的解析, 可以直接 np.frombuffer(view)
+    :return:
+        DATA_DEPTH: {"lastUpdateId": ..., "bids": memoryview[n, 2], "asks": memoryview[m, 2]}
+        DATA_BOOK_TICKER: memoryview[4] (bidPrice, bidQty, askPrice, askQty)
+        DATA_KLINE: memoryview[n, KLINE_FIELDS]
+        某一边深度或 K 线为空时对应的是长度为 0 的一维 memoryview
+    '''
+    view = memoryview(raw)
+    if data_type == DATA_DEPTH:
+        update_id, n_bids, n_asks = _DEPTH.unpack_from(raw)
+        split = _DEPTH.size + n_bids * 16
+        return {
+            'lastUpdateId': update_id,
+            'bids': _rows(view[_DEPTH.size:split], n_bids, 2),
+            'asks': _rows(view[split:split + n_asks * 16], n_asks, 2),
+        }
+    if data_type == DATA_KLINE:
+        return _rows(view, len(raw) // (8 * KLINE_FIELDS), KLINE_FIELDS)
+    return view.cast('d')
+
+
+class FeedWriter:
+    '''
+    共享内存环形缓冲区的写端, 只能有一个写进程, 也只有它的 close() 会删除共享内存.
+    每个槽位用状态戳做 seqlock: 写入时为 2*pos+1, 写完为 2*pos+2,
+    读端前后两次读到同一个偶数戳才认为数据有效.
+    共享内存大小约为 slots * slot_size, 默认 1024 x 32KB = 32MB, 要小于 /dev/shm 的容量
+    (docker 默认只有 64MB, 超出时创建不会报错, 写到后面才会 SIGBUS).
+    32KB 的槽位放得下 1000 档深度
+    '''
+
+    def __init__(self, name, slots=1024, slot_size=32768):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.shm = shared_memory.SharedMemory(name=name, create=True,
+                                              size=_HEADER.size + slots * slot_size)
+        _HEADER.pack_into(self.shm.buf, 0, _MAGIC, slots, slot_size, 0)
+        _created.add(self.shm.name)
+        self._count = 0
+        self._seqs = {}
+
+    def publish(self, data_type, symbol, payload):
+        '''
+        :param payload: encode_depth / encode_book_ticker / encode_kline 编码后的数据
+        :return: 该 symbol/类型 的序号
+        '''
+        name = symbol.encode()
+        if len(name) > 16:
+            raise ValueError('symbol %s is longer than 16 bytes' % symbol)
+        if _SLOT.size + len(payload) > self.slot_size:
+            raise ValueError('payload of %d bytes exceeds slot size %d' % (len(payload), self.slot_size))
+
+        key = (data_type, symbol)
+        seq = self._seqs.get(key, 0) + 1
+        self._seqs[key] = seq
+
+        pos = self._count
+        offset = _HEADER.size + (pos % self.slots) * self.slot_size
+        buf = self.shm.buf
+        _SLOT.pack_into(buf, offset, 2 * pos + 1, seq, int(1000 * time.time()),
+                        data_type, name, len(payload))
+        start = offset + _SLOT.size
+        buf[start:start + len(payload)] = payload
+        _STAMP.pack_into(buf, offset, 2 * pos + 2)
+
+        self._count = pos + 1
+        _COUNT.pack_into(buf, _HEADER.size - _COUNT.size, self._count)
+        return seq
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+        _created.discard(self.shm.name)
+
+
+class FeedReader:
+    '''
+    共享内存环形缓冲区的读端, 任意多个进程可同时读取, 不加锁.
+    读得太慢被写端覆盖时抛出 FeedOverrunError, 游标跳到仍然有效的最旧消息.
+    每条消息只做一次内存拷贝(写端随时可能覆盖槽位, 必须拷出来再校验状态戳), 不做解析;
+    返回的 memoryview 指向这份拷贝, 不是共享内存本身
+    '''
+
+    def __init__(self, name, from_start=False):
+        # 读端只 attach 不负责删除: 不能让本进程的 resource_tracker 在退出时 unlink 共享内存
+        if sys.version_info >= (3, 13):
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            if self.shm.name not in _created:
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+        magic, self.slots, self.slot_size, count = _HEADER.unpack_from(self.shm.buf, 0)
+        if magic != _MAGIC:
+            raise ValueError('shared memory %s is not a market data feed' % name)
+        self.cursor = max(0, count - self.slots) if from_start else count
+
+    def _written(self):
+        return _COUNT.unpack_from(self.shm.buf, _HEADER.size - _COUNT.size)[0]
+
+    def _skip_overrun(self, written):
+        oldest = max(0, written - self.slots)
+        if self.cursor < oldest:
+            lost = oldest - self.cursor
+            self.cursor = oldest
+            raise FeedOverrunError(lost)
+
+    def read(self):
+        '''
+        读取下一条消息
+        :return: (data_type, symbol, seq, ts, data) 或者没有新消息时返回 None
+        :raise: FeedOverrunError
+        '''
+        written = self._written()
+        if self.cursor >= written:
+            return None
+        self._skip_overrun(written)
+
+        pos = self.cursor
+        offset = _HEADER.size + (pos % self.slots) * self.slot_size
+        buf = self.shm.buf
+        stamp, seq, ts, data_type, symbol, length = _SLOT.unpack_from(buf, offset)
+        if stamp == 2 * pos + 2 and _SLOT.size + length <= self.slot_size:
+            start = offset + _SLOT.size
+            raw = bytes(buf[start:start + length])
+            # 拷贝完成后状态戳没变, 说明槽位头和数据都没有被写端改过, 这时才解码
+            if _STAMP.unpack_from(buf, offset)[0] == stamp:
+                data = decode(data_type, raw)
+                self.cursor = pos + 1
+                return data_type, symbol.rstrip(b'\0').decode(), seq, ts, data
+        # 槽位在读取过程中被写端覆盖
+        oldest = max(pos + 1, self._written() - self.slots)
+        self.cursor = oldest
+        raise FeedOverrunError(oldest - pos)
+
+    def __iter__(self):
+        while True:
+            msg = self.read()
+            if msg is None:
+                return
+            yield msg
+
+    def close(self):
+        self.shm.close()
+
+
+class MarketDataCollector:
+    '''
+    采集进程: 用一个 Client 轮询行情, 归一化后写入共享内存, 供多个策略进程读取
+    '''
+
+    def __init__(self, client, writer, symbols, kline_interval=None, depth_limit=100):
+        self.client = client
+        self.writer = writer
+        self.symbols = symbols
+        self.kline_interval = kline_interval
+        self.depth_limit = depth_limit
+
+    def poll_symbol(self, symbol):
+        depth = self.client.get_depth(symbol, self.depth_limit)
+        self.writer.publish(DATA_DEPTH, symbol, encode_depth(depth))
+        ticker = self.client.get_book_ticker(symbol)
+        self.writer.publish(DATA_BOOK_TICKER, symbol, encode_book_ticker(ticker))
+        if self.kline_interval:
+            klines = self.client.get_kline(symbol, self.kline_interval)
+            self.writer.publish(DATA_KLINE, symbol, encode_kline(klines))
+
+    def poll_once(self):
+        # 单个 symbol 出错(下架, 请求失败)只跳过它, 不影响其他 symbol
+        for symbol in self.symbols:
+            try:
+                self.poll_symbol(symbol)
+            except Exception as e:
+                logger.error('collector poll failed for %s: %s', symbol, e)
+
+    def run(self, interval=1.0):
+        while True:
+            started = time.time()
+            self.poll_once()
+            time.sleep(max(0.0, interval - (time.time() - started)))
@@ -0,0 +1,137 @@
+# coding=utf-8
+
+import time
+from collections import deque
+import numpy as np
+
+# 搜索兑换路径时优先经过的币种, 流动性好
+HUB_ASSETS = ('USDT', 'BTC', 'BNB', 'ETH')
+
+
+class Portfolio:
+    '''
+    账户估值: 用 get_exchange_info 的交易对构建兑换图, 预先算好每个币到计价币的最短兑换路径,
+    一次 get_recent_price 拉取全部价格后用 numpy 向量化计算所有余额 (free + locked) 的价值
+    '''
+
+    def __init__(self, client, quote='USDT', max_age=5.0, max_hops=3):
+        '''
+        :param quote: 计价币, 如 USDT / BTC
+        :param max_age: 价格缓存有效期(秒), 过期后 value() 会重新拉取全部价格
+        :param max_hops: 兑换路径最多经过的交易对数
+        '''
+        self.client = client
+        self.quote = quote
+        self.max_age = max_age
+        self.max_hops = max_hops
+        self.updated = 0.0
+        self.load_symbols()
+
+    def load_symbols(self):
+        '''
+        根据 get_exchange_info 重建兑换图和兑换路径, 交易对上下架后调用
+        '''
+        symbols = [s for s in self.client.get_exchange_info()['symbols'] if s.get('status', 'TRADING') == 'TRADING']
+        self.symbol_index = {s['symbol']: i for i, s in enumerate(symbols)}
+        self.prices = np.full(len(symbols), np.nan)
+        self.updated = 0.0
+
+        graph = {}
+        for i, s in enumerate(symbols):
+            # (对手币, 交易对下标, 是否取倒数)
+            graph.setdefault(s['baseAsset'], []).append((s['quoteAsset'], i, False))
+            graph.setdefault(s['quoteAsset'], []).append((s['baseAsset'], i, True))
+        for edges in graph.values():
+            edges.sort(key=lambda e: e[0] not in HUB_ASSETS)
+
+        self.asset_index = {a: i for i, a in enumerate(graph)}
+        self.asset_index.setdefault(self.quote, len(self.asset_index))
+        n = len(self.asset_index)
+        # 每个币的兑换路径: 依次经过的交易对下标(-1 为空)和是否取倒数
+        self.path_symbols = np.full((n, self.max_hops), -1, dtype=np.int64)
+        self.path_invert = np.zeros((n, self.max_hops), dtype=bool)
+        self.reachable = np.zeros(n, dtype=bool)
+        self.reachable[self.asset_index[self.quote]] = True
+
+        # 从计价币出发做 BFS, 得到每个币到计价币跳数最少的路径
+        hops = {self.quote: []}
+        queue = deque([self.quote])
+        while queue:
+            asset = queue.popleft()
+            if len(hops[asset]) >= self.max_hops:
+                continue
+            for other, i, invert in graph.get(asset, ()):
+                if other in hops:
+                    continue
+                # other -> asset: other 是 base 时直接乘价格, 否则乘倒数
+                hops[other] = [(i, not invert)] + hops[asset]
+                queue.append(other)
+        for asset, path in hops.items():
+            row = self.asset_index[asset]
+            self.reachable[row] = True
+            for k, (i, invert) in enumerate(path):
+                self.path_symbols[row, k] = i
+                self.path_invert[row, k] = invert
+
+    def refresh_prices(self):
+        '''
+        一次请求拉取全部交易对的最新价格
+        '''
+        self.update_prices(self.client.get_recent_price())
+        self.updated = time.time()
+
+    def update_prices(self, tickers):
+        '''
+        增量更新部分价格, 例如来自行情推送
+        :param tickers: [{"symbol": "LTCBTC", "price": "4.00000200"}, ...]
+        '''
+        index = self.symbol_index
+        rows, values = [], []
+        for t in tickers:
+            i = index.get(t['symbol'])
+            if i is not None:
+                rows.append(i)
+                values.append(t['price'])
+        self.prices[rows] = np.array(values, dtype=np.float64)
+
+    def rates(self):
+        '''
+        每个币兑换成计价币的汇率, 下标与 asset_index 一致, 无法兑换时为 nan
+        '''
+        used = self.path_symbols >= 0
+        p = self.prices[np.where(used, self.path_symbols, 0)]
+        # 停牌的交易对价格为 0, 当作没有价格, 避免取倒数得到 inf
+        p = np.where(p > 0, p, np.nan)
+        p = np.where(self.path_invert, 1.0 / p, p)
+        rates = np.where(used, p, 1.0).prod(axis=1)
+        rates[~self.reachable] = np.nan
+        return rates
+
+    def value(self, balances=None):
+        '''
+        账户估值
+        :param balances: get_account()["balances"], 不传则调用 get_account
+        :return:
+            {
+              "total": 总价值, 不含无法估值的币,
+              "assets": {"BTC": {"free": ..., "locked": ..., "value": ...}}
+            }
+            无法兑换成计价币的币 value 为 nan
+        '''
+        if time.time() - self.updated > self.max_age:
+            self.refresh_prices()
+        if balances is None:
+            balances = self.client.get_account()['balances']
+
+        free = np.array([b['free'] for b in balances], dtype=np.float64)
+        locked = np.array([b['locked'] for b in balances], dtype=np.float64)
+        # 兑换图里没有的币汇率记为 nan, 放在 rates 末尾
+        rates = np.append(self.rates(), np.nan)
+        rows = np.array([self.asset_index.get(b['asset'], -1) for b in balances], dtype=np.int64)
+        values = (free + locked) * rates[rows]
+
+        assets = {}
+        for b, f, l, v in zip(balances, free, locked, values):
+            if f or l:
+                assets[b['asset']] = {'free': float(f), 'locked': float(l), 'value': float(v)}
+        return {'total': float(np.nansum(values)), 'assets': assets}
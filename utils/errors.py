@@ -21,10 +21,16 @@ class BinanceAPIException(Exception):
         else:
             self.code = json_res['code']
             self.message = json_res['msg']
-        logger.error(self.message)
         self.status_code = response.status_code
         self.response = response
         self.request = getattr(response, 'request', None)
+        elapsed = getattr(response, 'elapsed', None)
+        logger.error(self.message, extra={
+            'endpoint': getattr(self.request, 'path_url', None),
+            'latency': elapsed.total_seconds() if elapsed is not None else None,
+            'code': self.code,
+            'status_code': self.status_code,
+        })
 
     def __str__(self):  # pragma: no cover
         return 'APIError(code=%s): %s' % (self.code, self.message)
@@ -44,7 +50,7 @@ class BinanceOrderException(Exception):
     def __init__(self, code, message):
         self.code = code
         self.message = message
-        logger.error(self.message)
+        logger.error(self.message, extra={'code': self.code})
 
     def __str__(self):
         return 'BinanceOrderException(code=%s): %s' % (self.code, self.message)
\ No newline at end of file
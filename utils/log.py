@@ -1,12 +1,150 @@
+import atexit
+import copy
+import json
 import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
 
-def setup_custom_logger(name, log_level=logging.INFO):
-    formatter = logging.Formatter(fmt='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
+# 队列最大长度, 满了直接丢弃, 不阻塞请求线程
+LOG_QUEUE_SIZE = 10000
+# 同一条错误在窗口内最多输出的次数
+ERROR_RATE_WINDOW = 10.0
+ERROR_RATE_LIMIT = 5
+# 限流表最多记录的不同错误数, 超过后清掉已过期的
+ERROR_RATE_KEYS = 1024
 
-    handler = logging.StreamHandler()
-    handler.setFormatter(formatter)
+# 结构化字段, 通过 logger.error(msg, extra={...}) 传入
+STRUCTURED_FIELDS = ('endpoint', 'latency', 'code', 'status_code')
 
+_lock = threading.Lock()
+_listeners = {}
+
+
+class JsonFormatter(logging.Formatter):
+    '''
+    把日志记录格式化为一行 JSON
+    '''
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'module': record.module,
+            'message': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            data['suppressed'] = suppressed
+        dropped = getattr(record, 'dropped', 0)
+        if dropped:
+            data['dropped'] = dropped
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    '''
+    对重复的错误限流: 同一 (级别, 消息) 在 window 秒内最多放行 limit 条,
+    窗口结束后的第一条记录带上被吞掉的条数.
+    消息应使用 logger.error('xxx: %s', e) 的形式, 预先拼好的消息每条都会占一个 key
+    '''
+
+    def __init__(self, window=ERROR_RATE_WINDOW, limit=ERROR_RATE_LIMIT, max_keys=ERROR_RATE_KEYS):
+        super().__init__()
+        self.window = window
+        self.limit = limit
+        self.max_keys = max_keys
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.levelno, record.msg, getattr(record, 'code', None))
+        now = time.monotonic()
+        with self._lock:
+            if key not in self._counts and len(self._counts) >= self.max_keys:
+                self._prune(now)
+            start, passed, dropped = self._counts.get(key, (now, 0, 0))
+            if now - start >= self.window:
+                record.suppressed = dropped
+                self._counts[key] = (now, 1, 0)
+                return True
+            if passed < self.limit:
+                record.suppressed = 0
+                self._counts[key] = (start, passed + 1, dropped)
+                return True
+            self._counts[key] = (start, passed, dropped + 1)
+            return False
+
+    def _prune(self, now):
+        for key in [k for k, (start, _, _) in self._counts.items() if now - start >= self.window]:
+            del self._counts[key]
+        # 窗口内的不同错误仍然太多, 放弃已有计数
+        if len(self._counts) >= self.max_keys:
+            self._counts.clear()
+
+
+class DropQueueHandler(QueueHandler):
+    '''
+    队列满了就丢弃记录并计数, 不阻塞调用线程. 丢弃的条数累计在 dropped 里,
+    并以 dropped 字段附在下一条成功入队的记录上.
+    与 QueueHandler 不同, 入队前不格式化消息, 保留 args 和 exc_info 交给后台线程处理
+    '''
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._unreported = 0
+
+    def prepare(self, record):
+        return copy.copy(record)
+
+    def enqueue(self, record):
+        # Handler.handle 已经加锁, 这里不会并发
+        if self._unreported:
+            record.dropped = self._unreported
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+        else:
+            self._unreported = 0
+
+
+def setup_custom_logger(name, log_level=logging.INFO, queue_size=LOG_QUEUE_SIZE):
+    '''
+    创建异步日志: 请求线程只负责入队, 格式化和输出都在后台 QueueListener 线程里完成.
+    重复调用返回同一个 logger, 不会叠加 handler.
+    注意 name 为 'root' 时拿到的就是根 logger, 此时 propagate 设置不起作用
+    '''
     logger = logging.getLogger(name)
     logger.setLevel(log_level)
-    logger.addHandler(handler)
+
+    with _lock:
+        if name in _listeners:
+            return logger
+
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter())
+
+        log_queue = queue.Queue(maxsize=queue_size)
+        queue_handler = DropQueueHandler(log_queue)
+        queue_handler.addFilter(RateLimitFilter())
+
+        listener = QueueListener(log_queue, handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+
+        logger.addHandler(queue_handler)
+        logger.propagate = False
+        _listeners[name] = listener
     return logger
@@ -0,0 +1,72 @@
+import threading
+import time
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished = 0.0
+
+
+class SingleFlight:
+    '''
+    合并并发的相同请求: 同一个 key 同时只发出一个请求, 其余调用方等待并共享结果或异常.
+    window > 0 时, 请求完成后的 window 秒内相同 key 的调用也直接复用该结果.
+    注意所有调用方拿到的是同一个返回对象, 不要原地修改
+    '''
+
+    MAX_KEYS = 1024
+
+    def __init__(self, window=0.0):
+        self.window = window
+        self.requests = 0
+        self.saved = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.done.is_set() and time.monotonic() - call.finished > self.window:
+                call = None
+            if call is None:
+                if len(self._calls) >= self.MAX_KEYS:
+                    self._prune()
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+                self.requests += 1
+            else:
+                leader = False
+                self.saved += 1
+
+        if leader:
+            try:
+                call.result = fn(*args)
+                return call.result
+            except BaseException as e:
+                # KeyboardInterrupt 等也要交给等待方, 否则它们会一直阻塞
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    call.finished = time.monotonic()
+                    if self.window <= 0 or call.error is not None:
+                        self._calls.pop(key, None)
+                call.done.set()
+
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _prune(self):
+        now = time.monotonic()
+        for key in [k for k, c in self._calls.items() if c.done.is_set() and now - c.finished > self.window]:
+            del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'saved': self.saved}